@@ -1,3 +1,4 @@
+import asyncio
 import io
 import os
 import logging
@@ -12,7 +13,8 @@ from fastapi import (
     HTTPException,
     status
 )
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, ORJSONResponse
+from starlette.formparsers import MultiPartParser
 
 from app.services.hybrid_encryptor import HybridEncryptor
 from app.services.key_session_manager import KeySessionManager
@@ -57,6 +59,15 @@ except ValueError:
     MAX_UPLOAD_MB = 50
 MAX_UPLOAD_BYTES = MAX_UPLOAD_MB * 1024 * 1024
 
+# Debug preview endpoint: never JSON-encode more than this much plaintext.
+PREVIEW_MAX_BYTES = 64 * 1024
+
+# Starlette spools multipart uploads to a temp file past 1 MiB, which
+# makes every non-trivial upload pay a disk round-trip before we even
+# start encrypting. We already cap uploads at MAX_UPLOAD_BYTES, so let
+# them stay in memory up to that limit.
+MultiPartParser.spool_max_size = MAX_UPLOAD_BYTES
+
 
 # ---------------------------
 # Helpers
@@ -104,10 +115,15 @@ async def initiate_session(
     logger.info("Initiating session: %s <-> %s (simulate_eavesdropper=%s)",
                 user_id, peer_id, simulate_eavesdropper)
     try:
-        encryptor.establish_session_key(
-            user_id,
-            peer_id,
-            simulate_eavesdropper=simulate_eavesdropper
+        # The QKD simulation is blocking CPU work; it runs on the
+        # encryptor's background pool (deduplicated per session) while the
+        # event loop keeps serving other requests.
+        await asyncio.wrap_future(
+            encryptor.submit_establish_session_key(
+                user_id,
+                peer_id,
+                simulate_eavesdropper=simulate_eavesdropper
+            )
         )
         session_id = f"{user_id}:{peer_id}"
         logger.info("Session established: %s", session_id)
@@ -126,7 +142,12 @@ async def initiate_session(
 
 @router.post(
     "/encrypt-file",
-    response_model=FileEncryptResponse,
+    # response_model deliberately disabled: validating FileEncryptResponse
+    # would run pydantic's str check over the entire hex ciphertext
+    # (potentially tens of MB) on every request. The handler returns the
+    # same shape via ORJSONResponse; FileEncryptResponse still documents it.
+    response_model=None,
+    responses={200: {"model": FileEncryptResponse}},
     summary="Encrypt a file and return its components"
 )
 async def encrypt_file(
@@ -172,11 +193,11 @@ async def encrypt_file(
         logger.info("Encryption successful: file=%s nonce_len=%d tag_len=%d ciphertext_len=%d",
                     filename, len(nonce), len(tag), len(ciphertext))
 
-        return FileEncryptResponse(
-            nonce=nonce.hex(),
-            tag=tag.hex(),
-            ciphertext=ciphertext.hex()
-        )
+        return ORJSONResponse({
+            "nonce": nonce.hex(),
+            "tag": tag.hex(),
+            "ciphertext": ciphertext.hex()
+        })
 
     except ValueError as e:
         logger.warning("ValueError during encryption: %s", e)
@@ -188,6 +209,254 @@ async def encrypt_file(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Encryption failed: {e}")
 
 
+@router.post(
+    "/encrypt-file-raw",
+    summary="Encrypt a file and return raw ciphertext bytes"
+)
+async def encrypt_file_raw(
+    user_id: str = Form(...),
+    peer_id: str = Form(...),
+    file: UploadFile = File(...),
+    encryptor: HybridEncryptor = Depends(get_encryptor)
+):
+    """
+    Encrypts an uploaded file and streams the raw ciphertext back, with the
+    nonce and tag in the X-Nonce / X-Tag response headers. Avoids the 2x
+    payload blow-up (and the hex-encoding CPU cost) of the JSON endpoint —
+    preferred for large files.
+    """
+    filename = getattr(file, "filename", "uploaded_file")
+    logger.info("Encrypt-raw request received: file=%s user=%s peer=%s",
+                filename, user_id, peer_id)
+
+    plaintext_bytes = await file.read()
+
+    if len(plaintext_bytes) > MAX_UPLOAD_BYTES:
+        logger.warning("Upload too large: %d bytes (max %d)",
+                       len(plaintext_bytes), MAX_UPLOAD_BYTES)
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Upload too large. Max supported size is {MAX_UPLOAD_MB} MB."
+        )
+
+    try:
+        encrypted_data = encryptor.encrypt_data(
+            plaintext_bytes, user_id, peer_id)
+
+        nonce = encrypted_data[:12]
+        tag = encrypted_data[-16:]
+        ciphertext = encrypted_data[12:-16]
+
+        logger.info("Encryption successful (raw): file=%s ciphertext_len=%d",
+                    filename, len(ciphertext))
+
+        return StreamingResponse(
+            io.BytesIO(ciphertext),
+            media_type="application/octet-stream",
+            headers={
+                "X-Nonce": nonce.hex(),
+                "X-Tag": tag.hex(),
+                "Content-Disposition": f"attachment; filename={filename}.enc"
+            }
+        )
+
+    except ValueError as e:
+        logger.warning("ValueError during raw encryption: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except Exception as e:
+        logger.exception("Raw encryption failed:")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Encryption failed: {e}")
+
+
+@router.post("/decrypt-file-raw", summary="Decrypt a raw ciphertext upload and return the file")
+async def decrypt_file_raw(
+    user_id: str = Form(...),
+    peer_id: str = Form(...),
+    nonce: str = Form(...),
+    tag: str = Form(...),
+    ciphertext_file: UploadFile = File(...),
+    filename: Optional[str] = Form(None),
+    encryptor: HybridEncryptor = Depends(get_encryptor)
+):
+    """
+    Counterpart of /encrypt-file-raw: takes the ciphertext as a binary
+    multipart upload (no hex round-trip), with nonce and tag as small hex
+    form fields, and returns the decrypted file.
+    """
+    logger.info("Decrypt-file-raw called for user=%s peer=%s filename=%s",
+                user_id, peer_id, filename)
+    try:
+        nonce_bytes = _hex_to_bytes(nonce, expected_len=12, field_name="nonce")
+        tag_bytes = _hex_to_bytes(tag, expected_len=16, field_name="tag")
+        ciphertext_bytes = await ciphertext_file.read()
+
+        # Single concat (ciphertext + tag); the nonce never gets copied into
+        # the big buffer.
+        decrypted_data = encryptor.decrypt_parts(
+            nonce_bytes, ciphertext_bytes + tag_bytes, user_id, peer_id)
+
+        download_name = filename or "decrypted_file"
+        logger.info("Raw decryption successful, returning file: %s (size=%d bytes)",
+                    download_name, len(decrypted_data))
+
+        return StreamingResponse(
+            io.BytesIO(decrypted_data),
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": f"attachment; filename={download_name}"}
+        )
+    except (ValueError, TypeError) as e:
+        logger.warning("Bad request during decrypt-file-raw: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except SecurityError as e:
+        logger.warning("Security error during decrypt-file-raw: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Raw decryption failed:")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Decryption failed: {e}")
+
+
+async def _read_exact(file: UploadFile, n: int) -> bytes:
+    """Reads exactly n bytes from an UploadFile (or fewer at end-of-stream)."""
+    parts = []
+    remaining = n
+    while remaining > 0:
+        piece = await file.read(remaining)
+        if not piece:
+            break
+        parts.append(piece)
+        remaining -= len(piece)
+    return b"".join(parts)
+
+
+@router.post(
+    "/encrypt-file-stream",
+    summary="Encrypt a file chunk-by-chunk and stream the ciphertext"
+)
+async def encrypt_file_stream(
+    user_id: str = Form(...),
+    peer_id: str = Form(...),
+    file: UploadFile = File(...),
+    encryptor: HybridEncryptor = Depends(get_encryptor)
+):
+    """
+    Streams the upload through AES-GCM in 1 MiB chunks instead of buffering
+    the whole file. Peak memory is O(chunk), not O(file), so this endpoint
+    has no upload size cap.
+
+    Response body layout: [8-byte nonce prefix] then, per chunk,
+    [4-byte frame length] + [ciphertext + tag], ending with a sealed
+    zero-length chunk that authenticates end-of-stream. Decrypt with
+    /decrypt-file-stream.
+    """
+    filename = getattr(file, "filename", "uploaded_file")
+    logger.info("Encrypt-stream request received: file=%s user=%s peer=%s",
+                filename, user_id, peer_id)
+
+    # Fail fast (before streaming starts) if no session key exists.
+    if not encryptor.key_manager.has_key(user_id, peer_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No session key found for {user_id}:{peer_id}. Please initiate session.")
+
+    nonce_prefix = encryptor.aes_encryptor.new_nonce_prefix()
+    chunk_size = encryptor.aes_encryptor.CHUNK_SIZE
+
+    async def ciphertext_generator():
+        yield nonce_prefix
+        counter = 0
+        while True:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                break
+            yield encryptor.encrypt_chunk(
+                chunk, user_id, peer_id, nonce_prefix, counter)
+            counter += 1
+        # Terminal zero-length chunk: its tag is bound to the final
+        # counter, so a truncated stream fails decryption instead of
+        # passing for a complete (shorter) file.
+        yield encryptor.encrypt_chunk(
+            b"", user_id, peer_id, nonce_prefix, counter)
+        logger.info("Encrypt-stream finished: file=%s chunks=%d",
+                    filename, counter)
+
+    return StreamingResponse(
+        ciphertext_generator(),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f"attachment; filename={filename}.enc"}
+    )
+
+
+@router.post(
+    "/decrypt-file-stream",
+    summary="Decrypt a chunked ciphertext stream and return the file"
+)
+async def decrypt_file_stream(
+    user_id: str = Form(...),
+    peer_id: str = Form(...),
+    ciphertext_file: UploadFile = File(...),
+    filename: Optional[str] = Form(None),
+    encryptor: HybridEncryptor = Depends(get_encryptor)
+):
+    """
+    Counterpart of /encrypt-file-stream: reads the framed ciphertext chunk
+    by chunk and streams the decrypted plaintext back.
+    """
+    logger.info("Decrypt-file-stream called for user=%s peer=%s filename=%s",
+                user_id, peer_id, filename)
+
+    if not encryptor.key_manager.has_key(user_id, peer_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No session key found for {user_id}:{peer_id}. Please initiate session.")
+
+    prefix_size = encryptor.aes_encryptor.NONCE_PREFIX_SIZE
+    header_size = encryptor.aes_encryptor.FRAME_HEADER_SIZE
+
+    nonce_prefix = await _read_exact(ciphertext_file, prefix_size)
+    if len(nonce_prefix) != prefix_size:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Ciphertext stream truncated: missing nonce prefix.")
+
+    async def plaintext_generator():
+        counter = 0
+        while True:
+            header = await _read_exact(ciphertext_file, header_size)
+            if not header:
+                # EOF before the sealed end-of-stream chunk: the stream
+                # was cut at a frame boundary, which per-chunk tags alone
+                # cannot detect.
+                raise ValueError(
+                    "Ciphertext stream truncated: missing end-of-stream frame.")
+            if len(header) != header_size:
+                raise ValueError("Ciphertext stream truncated: bad frame header.")
+            frame_len = int.from_bytes(header, "big")
+            frame_body = await _read_exact(ciphertext_file, frame_len)
+            if len(frame_body) != frame_len:
+                raise ValueError("Ciphertext stream truncated: short frame.")
+            plaintext = encryptor.decrypt_chunk(
+                frame_body, user_id, peer_id, nonce_prefix, counter)
+            if not plaintext:
+                # Authenticated end-of-stream marker.
+                break
+            yield plaintext
+            counter += 1
+
+    download_name = filename or "decrypted_file"
+    return StreamingResponse(
+        plaintext_generator(),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f"attachment; filename={download_name}"}
+    )
+
+
 @router.post("/decrypt-file", summary="Decrypt components and return the file")
 async def decrypt_file(
     user_id: str = Form(...),
@@ -212,10 +481,10 @@ async def decrypt_file(
         ciphertext_bytes = _hex_to_bytes(
             ciphertext, expected_len=None, field_name="ciphertext")
 
-        encrypted_data = nonce_bytes + ciphertext_bytes + tag_bytes
-
-        decrypted_data = encryptor.decrypt_data(
-            encrypted_data, user_id, peer_id)
+        # One concat instead of two: the nonce is passed separately so the
+        # multi-MB ciphertext is only copied once.
+        decrypted_data = encryptor.decrypt_parts(
+            nonce_bytes, ciphertext_bytes + tag_bytes, user_id, peer_id)
 
         download_name = filename or "decrypted_file"
         logger.info("Decryption successful, returning file: %s (size=%d bytes)",
@@ -270,24 +539,35 @@ async def decrypt_file_preview(
         ciphertext_bytes = _hex_to_bytes(
             ciphertext, expected_len=None, field_name="ciphertext")
 
-        encrypted_data = nonce_bytes + ciphertext_bytes + tag_bytes
-
-        decrypted_data = encryptor.decrypt_data(
-            encrypted_data, user_id, peer_id)
+        decrypted_data = encryptor.decrypt_parts(
+            nonce_bytes, ciphertext_bytes + tag_bytes, user_id, peer_id)
 
         # --- Smart Preview Logic ---
         try:
-            # Try to decode the decrypted bytes as UTF-8 text
-            plaintext = decrypted_data.decode('utf-8')
+            # Try to decode the decrypted bytes as UTF-8 text. Only the
+            # first PREVIEW_MAX_BYTES are previewed — this is a debug
+            # endpoint, no reason to JSON-encode a 50 MB file. Returning
+            # ORJSONResponse directly (both branches) skips a pydantic
+            # validation pass over the large string.
+            chunk = decrypted_data[:PREVIEW_MAX_BYTES]
+            try:
+                plaintext = chunk.decode('utf-8')
+            except UnicodeDecodeError as e:
+                # Truncation may have split a multi-byte character right at
+                # the cap; that's still text, so trim the partial char.
+                if len(decrypted_data) > PREVIEW_MAX_BYTES and e.start >= PREVIEW_MAX_BYTES - 4:
+                    plaintext = chunk[:e.start].decode('utf-8')
+                else:
+                    raise
             logger.info("Preview decode successful, length=%d", len(plaintext))
-            return TextDecryptPreviewResponse(
-                status="success",
-                plaintext=plaintext
-            )
+            return ORJSONResponse({
+                "status": "success",
+                "plaintext": plaintext
+            })
         except UnicodeDecodeError:
             logger.info("Preview decode failed: binary data")
             # If it fails, it's a binary file (like a .docx or .jpg)
-            return JSONResponse(
+            return ORJSONResponse(
                 status_code=200,  # Still a success, but with a note
                 content={
                     "status": "binary_file",
@@ -1,8 +1,89 @@
+import hashlib
 import os
+import platform
+import threading
+from collections import OrderedDict
+from typing import Optional
+
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.exceptions import InvalidTag
 
 
+def describe_aes_backend() -> str:
+    """
+    Returns a human-readable description of the AES backend in use,
+    e.g. "OpenSSL 3.2.1 (hardware AES: yes)".
+
+    Raises RuntimeError if cryptography is not backed by OpenSSL (i.e. a
+    pure-Python AES implementation would be in play) — that is a 20x+
+    throughput regression this service should never run with.
+
+    The hardware probe reads /proc/cpuinfo: on x86_64 it looks for the
+    aes + pclmulqdq flags (AES-NI and carry-less multiply for GHASH), on
+    aarch64 for aes + pmull (ARMv8 Crypto Extensions). Elsewhere it
+    reports "unknown" rather than guessing.
+    """
+    try:
+        from cryptography.hazmat.backends.openssl.backend import backend
+        version = backend.openssl_version_text()
+    except Exception as e:
+        raise RuntimeError(
+            f"cryptography is not using its OpenSSL backend ({e}); "
+            "refusing to fall back to software AES.")
+
+    hw = "unknown"
+    machine = platform.machine().lower()
+    wanted = None
+    if machine in ("x86_64", "amd64"):
+        wanted = {"aes", "pclmulqdq"}
+    elif machine in ("aarch64", "arm64"):
+        wanted = {"aes", "pmull"}
+    if wanted is not None:
+        try:
+            with open("/proc/cpuinfo") as f:
+                cpuinfo = f.read()
+            flags = set()
+            for line in cpuinfo.splitlines():
+                if line.startswith(("flags", "Features")):
+                    flags.update(line.split(":", 1)[1].split())
+            hw = "yes" if wanted <= flags else "NO (software fallback!)"
+        except OSError:
+            pass
+
+    return f"{version} (hardware AES: {hw})"
+
+
+class NonceCounter:
+    """
+    Deterministic GCM nonce source for one session:
+    nonce = [4-byte random salt] + [8-byte big-endian counter].
+
+    This is the standard counter-based GCM nonce construction — unique per
+    message as long as the counter never wraps (2^64 messages), without an
+    os.urandom syscall per encryption. Thread-safe.
+
+    Only safe while the key is confined to this process: independent
+    NonceCounter instances (other workers, or a restart) draw independent
+    32-bit salts, and a salt collision under the same key reuses nonces.
+    For keys shared via an external store, use random nonces instead.
+    """
+
+    SALT_SIZE = 4
+    COUNTER_SIZE = 8
+
+    def __init__(self):
+        self._salt = os.urandom(self.SALT_SIZE)
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def next(self) -> bytes:
+        """Returns the next 12-byte nonce and advances the counter."""
+        with self._lock:
+            counter = self._counter
+            self._counter += 1
+        return self._salt + counter.to_bytes(self.COUNTER_SIZE, "big")
+
+
 class AESGCMEncryptor:
     """
     Handles AES-256-GCM encryption and decryption.
@@ -14,23 +95,91 @@ class AESGCMEncryptor:
     - Explicitly catches InvalidTag on decryption.
     """
 
+    # Chunked (streaming) mode parameters.
+    # Each chunk is sealed independently with nonce = [8-byte random prefix]
+    # + [4-byte big-endian chunk counter], and framed on the wire as
+    # [4-byte big-endian frame length] + [ciphertext + tag]. A stream ends
+    # with a zero-length chunk (tag only): data chunks are never empty, so
+    # an empty plaintext unambiguously marks end-of-stream, and because its
+    # tag is bound to the final counter value a truncated or spliced stream
+    # fails authentication instead of decrypting short.
+    CHUNK_SIZE = 1 << 20          # 1 MiB of plaintext per chunk
+    NONCE_PREFIX_SIZE = 8
+    FRAME_HEADER_SIZE = 4
+
     def __init__(self, key_size_bytes=32):
         self.KEY_SIZE = key_size_bytes
         self.NONCE_SIZE = 12  # Standard for GCM
         self.TAG_SIZE = 16    # Standard for GCM
+        # AESGCM(key) re-derives the AES round-key schedule in OpenSSL on
+        # every construction. Session keys are long-lived, so cache the
+        # constructed object, keyed by a key fingerprint (never the raw
+        # key) so key bytes don't double as dict keys. LRU-bounded so a
+        # multi-tenant deployment with many sessions can't grow it without
+        # limit; retired keys are purged eagerly via discard_key.
+        self._aesgcm_cache: "OrderedDict[bytes, AESGCM]" = OrderedDict()
+        self._aesgcm_cache_max = 1024
+        # Guards the OrderedDict: its get/move_to_end/popitem bookkeeping
+        # is a multi-step mutation, and discard_key fires from other
+        # threads on every rotate/delete. The critical section is a few
+        # dict ops — negligible next to the AES call it fronts.
+        self._aesgcm_cache_lock = threading.Lock()
+
+    @staticmethod
+    def _key_fingerprint(key: bytes) -> bytes:
+        return hashlib.sha256(key).digest()[:16]
+
+    def _get_aesgcm(self, key: bytes) -> AESGCM:
+        fingerprint = self._key_fingerprint(key)
+        cache = self._aesgcm_cache
+        with self._aesgcm_cache_lock:
+            aesgcm = cache.get(fingerprint)
+            if aesgcm is not None:
+                cache.move_to_end(fingerprint)
+                return aesgcm
+        # Build the context outside the lock (it hits OpenSSL); a racing
+        # builder for the same key just overwrites with an equivalent one.
+        aesgcm = AESGCM(key)
+        with self._aesgcm_cache_lock:
+            cache[fingerprint] = aesgcm
+            if len(cache) > self._aesgcm_cache_max:
+                cache.popitem(last=False)  # evict least recently used
+        return aesgcm
+
+    def discard_key(self, key: bytes) -> None:
+        """Drops the cached cipher context for a retired key."""
+        with self._aesgcm_cache_lock:
+            self._aesgcm_cache.pop(self._key_fingerprint(key), None)
+
+    def clear_key_cache(self) -> None:
+        """Drops all cached cipher contexts."""
+        with self._aesgcm_cache_lock:
+            self._aesgcm_cache.clear()
+
+    def new_session(self) -> NonceCounter:
+        """Creates a fresh counter-based nonce source for a session."""
+        return NonceCounter()
 
-    def encrypt(self, plaintext: bytes, key: bytes) -> bytes:
+    def encrypt(self, plaintext: bytes, key: bytes,
+                nonce_counter: Optional[NonceCounter] = None) -> bytes:
         """
         Encrypts plaintext bytes using AES-256-GCM.
+
+        With a nonce_counter (see new_session), nonces come from the
+        salt+counter construction — no per-message os.urandom syscall.
+        Without one, a random nonce is drawn as before.
         """
         if len(key) != self.KEY_SIZE:
             raise ValueError(
                 f"Invalid key size. Must be {self.KEY_SIZE} bytes.")
 
-        # 1. Generate a secure, random 12-byte nonce
-        nonce = os.urandom(self.NONCE_SIZE)
+        # 1. Obtain a unique 12-byte nonce
+        if nonce_counter is not None:
+            nonce = nonce_counter.next()
+        else:
+            nonce = os.urandom(self.NONCE_SIZE)
 
-        aesgcm = AESGCM(key)
+        aesgcm = self._get_aesgcm(key)
 
         # 2. Encrypt. The 'encrypt' method returns (ciphertext + tag).
         ciphertext_with_tag = aesgcm.encrypt(nonce, plaintext, None)
@@ -41,20 +190,33 @@ class AESGCMEncryptor:
     def decrypt(self, encrypted_data: bytes, key: bytes) -> bytes:
         """
         Decrypts data encrypted with AES-256-GCM.
+
+        Accepts the combined [nonce][ciphertext][tag] layout produced by
+        encrypt(). Callers that already hold the pieces separately should
+        use decrypt_parts() to avoid re-concatenating the full buffer.
+        """
+        # memoryview slicing avoids copying the (potentially large)
+        # ciphertext just to split off the 12-byte nonce.
+        view = memoryview(encrypted_data)
+        return self.decrypt_parts(
+            bytes(view[:self.NONCE_SIZE]), view[self.NONCE_SIZE:], key)
+
+    def decrypt_parts(self, nonce: bytes, ciphertext_with_tag: bytes, key: bytes) -> bytes:
+        """
+        Decrypts from separate nonce and (ciphertext + tag) buffers.
+
+        Saves one full-ciphertext copy per request compared to gluing the
+        components back into a single buffer first.
         """
         if len(key) != self.KEY_SIZE:
             raise ValueError(
                 f"Invalid key size. Must be {self.KEY_SIZE} bytes.")
 
         try:
-            # 1. Extract the components
-            nonce = encrypted_data[:self.NONCE_SIZE]
-            ciphertext_with_tag = encrypted_data[self.NONCE_SIZE:]
+            aesgcm = self._get_aesgcm(key)
 
-            aesgcm = AESGCM(key)
-
-            # 2. Decrypt. This will automatically verify the tag.
-            #    If tampered, this line raises InvalidTag.
+            # Decrypt. This will automatically verify the tag.
+            # If tampered, this line raises InvalidTag.
             plaintext = aesgcm.decrypt(nonce, ciphertext_with_tag, None)
 
             return plaintext
@@ -66,3 +228,48 @@ class AESGCMEncryptor:
                 "Decryption failed: Data tampered or invalid key.")
         except Exception as e:
             raise ValueError(f"Decryption error: {e}")
+
+    def new_nonce_prefix(self) -> bytes:
+        """Generates the random 8-byte nonce prefix for a chunked stream."""
+        return os.urandom(self.NONCE_PREFIX_SIZE)
+
+    def _chunk_nonce(self, nonce_prefix: bytes, counter: int) -> bytes:
+        if len(nonce_prefix) != self.NONCE_PREFIX_SIZE:
+            raise ValueError(
+                f"Invalid nonce prefix. Must be {self.NONCE_PREFIX_SIZE} bytes.")
+        return nonce_prefix + counter.to_bytes(4, "big")
+
+    def encrypt_chunk(self, chunk: bytes, key: bytes, nonce_prefix: bytes, counter: int) -> bytes:
+        """
+        Encrypts one chunk of a stream and returns the framed bytes:
+        [4-byte length] + [ciphertext + tag]. Pass an empty chunk to seal
+        the end-of-stream marker (see the chunked-mode notes above).
+
+        Peak memory is O(chunk) rather than O(file), so arbitrarily large
+        uploads can be processed with a bounded footprint.
+        """
+        if len(key) != self.KEY_SIZE:
+            raise ValueError(
+                f"Invalid key size. Must be {self.KEY_SIZE} bytes.")
+
+        nonce = self._chunk_nonce(nonce_prefix, counter)
+        ciphertext_with_tag = self._get_aesgcm(key).encrypt(nonce, chunk, None)
+        return len(ciphertext_with_tag).to_bytes(self.FRAME_HEADER_SIZE, "big") + ciphertext_with_tag
+
+    def decrypt_chunk(self, frame_body: bytes, key: bytes, nonce_prefix: bytes, counter: int) -> bytes:
+        """
+        Decrypts one framed chunk body (ciphertext + tag, without the
+        4-byte length header) produced by encrypt_chunk.
+        """
+        if len(key) != self.KEY_SIZE:
+            raise ValueError(
+                f"Invalid key size. Must be {self.KEY_SIZE} bytes.")
+
+        nonce = self._chunk_nonce(nonce_prefix, counter)
+        try:
+            return self._get_aesgcm(key).decrypt(nonce, frame_body, None)
+        except InvalidTag:
+            raise ValueError(
+                "Decryption failed: Data tampered or invalid key.")
+        except Exception as e:
+            raise ValueError(f"Decryption error: {e}")
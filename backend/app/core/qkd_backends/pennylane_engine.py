@@ -1,29 +1,88 @@
-import pennylane as qml
-from pennylane import numpy as np
-import hashlib
+import logging
+import os
+
+import numpy as np
+
 from app.core.exceptions import SecurityError
 
+logger = logging.getLogger(__name__)
+
+
+# PennyLane is only needed for the optional single-shot circuit
+# validation below — importing it drags in autograd/scipy and costs
+# hundreds of ms of worker start-up, so it is loaded lazily. Set
+# QKD_USE_PENNYLANE=1 to initialize the device eagerly at import time.
+_bb84_qnodes = None
+
+
+def _init_pennylane():
+    """
+    Builds the single-qubit BB84 device and QNodes on first use.
+
+    One fixed QNode is built per (alice_basis, bob_basis) combination and
+    dispatched by 2-bit index, and Alice's bit enters as an RX gate angle
+    rather than Python control flow — so the quantum tape structure is
+    constant per QNode instead of being rebuilt from an `if` ladder on
+    every call.
+    """
+    global _bb84_qnodes
+    if _bb84_qnodes is not None:
+        return _bb84_qnodes
+
+    import numpy as _np
+    import pennylane as qml
+
+    dev = qml.device("lightning.qubit", wires=1, shots=1)
 
-dev = qml.device("lightning.qubit", wires=1, shots=1)
+    def make_circuit(alice_basis, bob_basis):
+        @qml.qnode(dev)
+        def circuit(alice_bit):
+            # 1. Alice prepares her qubit: RX(pi) flips |0> to |1> (up to
+            # a global phase), RX(0) is the identity.
+            qml.RX(_np.pi * alice_bit, wires=0)
+            if alice_basis == 1:
+                qml.Hadamard(wires=0)  # Diagonal basis |+> or |->
+
+            # 2. Bob measures the qubit in his chosen basis
+            if bob_basis == 1:
+                qml.Hadamard(wires=0)  # Back to rectilinear
+
+            # 3. Measurement in the Z basis
+            return qml.sample(wires=0)
+
+        return circuit
+
+    qnodes = [make_circuit(a >> 1, a & 1) for a in range(4)]
+
+    # Opt-in: compile the validation QNodes with Catalyst so repeated
+    # shots reuse a compiled binary instead of re-tracing. Pays a one-off
+    # compile cost per process; pointless unless validation runs in bulk.
+    if os.getenv("QKD_USE_CATALYST"):
+        try:
+            from catalyst import qjit
+        except ImportError:
+            pass  # catalyst not installed; plain QNodes work fine
+        else:
+            qnodes = [qjit(circuit) for circuit in qnodes]
+
+    _bb84_qnodes = qnodes
+    return _bb84_qnodes
 
 
-@qml.qnode(dev)
 def bb84_circuit(alice_bit, alice_basis, bob_basis):
     """
     Simulates a single qubit exchange in the BB84 protocol.
+
+    NOTE: kept for single-shot validation/demonstration only. The hot path
+    in run_protocol() uses the equivalent closed-form NumPy model below.
+    Initializes PennyLane on first call.
     """
-    # 1. Alice prepares her qubit
-    if alice_bit == 1:
-        qml.PauliX(wires=0)  # Flip |0> to |1>
-    if alice_basis == 1:
-        qml.Hadamard(wires=0)  # Change to diagonal basis |+> or |->
+    qnodes = _init_pennylane()
+    return qnodes[(int(alice_basis) << 1) | int(bob_basis)](alice_bit)
 
-    # 2. Bob measures the qubit in his chosen basis
-    if bob_basis == 1:
-        qml.Hadamard(wires=0)  # Change from diagonal back to rectilinear
 
-    # 3. Measurement in the Z basis
-    return qml.sample(wires=0)
+if os.getenv("QKD_USE_PENNYLANE"):
+    _init_pennylane()
 
 
 class PennylaneQKD:
@@ -44,30 +103,38 @@ class PennylaneQKD:
                                           errors to fail the QBER check.
         """
 
-        # ... (Step 1 & 2: Generate bits and run circuit - no changes) ...
+        # ... (Step 1 & 2: Generate bits and measure - no changes) ...
         n_bits = key_length_bits * self.redundancy_factor
 
-        alice_bits = np.random.randint(0, 2, n_bits)
-        alice_bases = np.random.randint(0, 2, n_bits)
-        bob_bases = np.random.randint(0, 2, n_bits)
-        bob_bits = []
-
-        for i in range(n_bits):
-            measured_bit = bb84_circuit(
-                alice_bit=alice_bits[i],
-                alice_basis=alice_bases[i],
-                bob_basis=bob_bases[i]
-            )
-            bob_bits.append(int(measured_bit[0]))  # Bug fix from before
-
-        bob_bits = np.array(bob_bits)
+        # One PCG64 generator per protocol run (faster than the legacy
+        # global MT19937 and free of global-RNG lock contention when
+        # sessions initiate concurrently), and one draw for all four bit
+        # streams instead of four separate C-boundary crossings.
+        rng = np.random.default_rng()
+        bits = rng.integers(0, 2, (4, n_bits), dtype=np.uint8)
+        alice_bits, alice_bases, bob_bases, random_bits = bits
+
+        # Closed-form, vectorized BB84 measurement. The single-qubit circuit
+        # has no entanglement, so its statistics are exactly reproducible
+        # classically: if Bob measures in Alice's basis he reads her bit;
+        # otherwise the outcome is a uniformly random bit. This replaces
+        # n_bits QNode invocations (the hottest path in session initiation)
+        # with three NumPy array ops.
+        if os.getenv("QKD_BACKEND", "").lower() == "numba":
+            # Opt-in per-qubit kernel, parallel-compiled with Numba.
+            from app.core.qkd_backends.pennylane_engine_numba import bb84_batch
+            bob_bits = bb84_batch(
+                alice_bits, alice_bases, bob_bases, random_bits)
+        else:
+            matching = (alice_bases == bob_bases)
+            bob_bits = np.where(matching, alice_bits, random_bits)
 
         # --- NEW SIMULATION LOGIC ---
         if simulate_eavesdropper:
-            print("--- SIMULATING EAVESDROPPER: INTRODUCING NOISE ---")
+            logger.debug("Simulating eavesdropper: introducing noise")
             # Flip ~50% of Bob's bits to guarantee a high QBER
-            noise_indices = np.random.choice(
-                range(n_bits),
+            noise_indices = rng.choice(
+                n_bits,
                 size=n_bits // 2,
                 replace=False
             )
@@ -90,8 +157,8 @@ class PennylaneQKD:
         if n_check_bits == 0 and n_sifted > 0:
             n_check_bits = 1
 
-        check_indices = np.random.choice(
-            range(n_sifted), size=n_check_bits, replace=False)
+        check_indices = rng.choice(
+            n_sifted, size=n_check_bits, replace=False)
 
         error_count = np.sum(
             sifted_key_alice[check_indices] != sifted_key_bob[check_indices])
@@ -105,8 +172,11 @@ class PennylaneQKD:
         # ... (Rest of the function is unchanged) ...
 
         # 5. Final Key Generation
-        final_key_indices = np.setdiff1d(range(n_sifted), check_indices)
-        final_key_bits = sifted_key_bob[final_key_indices]
+        # Boolean mask instead of np.setdiff1d: O(n) contiguous scan, no
+        # sort and no materialized range.
+        keep_mask = np.ones(n_sifted, dtype=bool)
+        keep_mask[check_indices] = False
+        final_key_bits = sifted_key_bob[keep_mask]
 
         if len(final_key_bits) < key_length_bits:
             raise RuntimeError(
@@ -114,8 +184,8 @@ class PennylaneQKD:
 
         final_key_bits = final_key_bits[:key_length_bits]
 
-        key_binary_string = "".join(map(str, final_key_bits))
-        key_int = int(key_binary_string, 2)
-        key_hex = f'{key_int:x}'.zfill(key_length_bits // 4)
+        # Pack the bit array straight to bytes in C instead of going
+        # through a Python string -> arbitrary-precision int -> hex chain.
+        key_hex = np.packbits(final_key_bits.astype(np.uint8)).tobytes().hex()
 
         return key_hex
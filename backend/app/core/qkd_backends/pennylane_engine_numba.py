@@ -0,0 +1,34 @@
+"""
+Numba-compiled BB84 measurement kernel.
+
+Optional alternative to the closed-form NumPy path in pennylane_engine:
+it keeps an explicit per-qubit loop (useful when the bitwise model needs
+to be demonstrated step by step) but compiles it to parallel machine
+code instead of dispatching through Python.
+
+Select it with the env var QKD_BACKEND=numba. Requires the `numba`
+package, which is intentionally not in requirements.txt — this backend
+is opt-in.
+"""
+import numpy as np
+from numba import njit, prange
+
+
+# cache=True persists the compiled kernel on disk so the ~30 s first-call
+# compile cost is paid once per machine, not once per process restart.
+@njit(parallel=True, cache=True)
+def bb84_batch(alice_bits, alice_bases, bob_bases, random_bits):
+    """
+    Measures a batch of BB84 qubit exchanges.
+
+    Per qubit: if Bob's basis matches Alice's he reads her bit, otherwise
+    the measurement collapses to the supplied uniform random bit.
+    """
+    n = alice_bits.shape[0]
+    bob_bits = np.empty(n, dtype=alice_bits.dtype)
+    for i in prange(n):
+        if alice_bases[i] == bob_bases[i]:
+            bob_bits[i] = alice_bits[i]
+        else:
+            bob_bits[i] = random_bits[i]
+    return bob_bits
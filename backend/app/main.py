@@ -1,8 +1,11 @@
+import logging
 import os
+import time
 from typing import List
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
 # optional: load .env in dev (install python-dotenv)
 try:
@@ -14,11 +17,16 @@ except Exception:
 # import your router
 from app.api.routes import encryption
 
+logger = logging.getLogger("app.main")
+
 # App metadata
 app = FastAPI(
     title="QuantumCrypt Sentinel API",
     description="API for secure file encryption using a Quantum-Resistant Hybrid Protocol.",
-    version="1.0.0"
+    version="1.0.0",
+    # orjson serializes the large hex payloads (nonce/tag/ciphertext
+    # responses) several times faster than the stdlib json encoder.
+    default_response_class=ORJSONResponse
 )
 
 # --- CORS configuration (from env or defaults) ---
@@ -59,6 +67,56 @@ app.include_router(
 )
 
 
+# Rough floor for hardware-accelerated AES-GCM. Software (non-AES-NI)
+# OpenSSL builds typically land well under this; wheel builds with the
+# accelerated assembly do 1-5 GB/s per core.
+_AES_HW_THRESHOLD_MB_S = 500
+
+
+@app.on_event("startup")
+def check_aes_gcm_throughput():
+    """
+    Quick AES-GCM self-benchmark to verify the hardware path is active.
+
+    cryptography dispatches to OpenSSL, which only uses AES-NI + PCLMULQDQ
+    when the bundled build carries the accelerated assembly (some Alpine /
+    old manylinux images do not). Encrypt 1 MiB buffers for ~100 ms and
+    warn loudly if throughput looks like the software fallback.
+    """
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+    aesgcm = AESGCM(os.urandom(32))
+    nonce = os.urandom(12)
+    buf = os.urandom(1 << 20)
+
+    aesgcm.encrypt(nonce, buf, None)  # warm-up
+
+    start = time.perf_counter()
+    iterations = 0
+    while time.perf_counter() - start < 0.1:
+        aesgcm.encrypt(nonce, buf, None)
+        iterations += 1
+    elapsed = time.perf_counter() - start
+    mb_per_s = iterations / elapsed  # each iteration is 1 MiB
+
+    if mb_per_s < _AES_HW_THRESHOLD_MB_S:
+        logger.warning(
+            "AES-GCM throughput is %.0f MB/s (< %d MB/s): OpenSSL appears to "
+            "be running WITHOUT AES-NI/PCLMULQDQ. Install the official "
+            "'cryptography' wheels (they bundle an accelerated OpenSSL) "
+            "instead of building against a system OpenSSL.",
+            mb_per_s, _AES_HW_THRESHOLD_MB_S)
+    else:
+        logger.info("AES-GCM self-test: %.0f MB/s (hardware path active).",
+                    mb_per_s)
+
+
+@app.on_event("startup")
+def warm_up_qkd_engine():
+    """Pays the QKD engine's first-call costs before traffic arrives."""
+    encryption.get_encryptor().warm_up()
+
+
 @app.get("/", tags=["Root"])
 def read_root():
     """Root endpoint for API health check."""
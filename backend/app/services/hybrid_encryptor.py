@@ -1,59 +1,246 @@
-from app.core.aes_gcm import AESGCMEncryptor
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+
+from app.core.aes_gcm import AESGCMEncryptor, describe_aes_backend
 from app.core.qkd_backends.pennylane_engine import PennylaneQKD
 from app.core.dem_mixer import generate_final_key
 from app.services.key_session_manager import KeySessionManager
 
+logger = logging.getLogger(__name__)
+
+
 class HybridEncryptor:
     """
     A service facade that orchestrates the entire
     QKD -> DEM -> AES encryption flow.
     """
-    
+
     def __init__(self, key_manager: KeySessionManager):
         self.qkd_engine = PennylaneQKD()
         self.aes_encryptor = AESGCMEncryptor()
+        # Fails fast if cryptography is not on its OpenSSL backend; the
+        # engine name is logged on first key establishment.
+        self.aes_engine_name = describe_aes_backend()
+        self._engine_logged = False
         self.key_manager = key_manager
         self.KEY_BIT_LENGTH = 256  # For AES-256
         self.KEY_BYTE_LENGTH = self.KEY_BIT_LENGTH // 8
+        # Per-session establishment locks: concurrent initiations for the
+        # SAME pair still run QKD only once, but distinct pairs establish
+        # in parallel across threads. The outer lock only guards the tiny
+        # lock-table insert.
+        self._establish_locks_guard = threading.Lock()
+        self._establish_locks = {}
+        # Background establishment: QKD runs on this pool so callers can
+        # return immediately while the key materializes; in-flight runs
+        # are tracked per session so encrypt/decrypt can await them.
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=os.cpu_count(),
+            thread_name_prefix="qkd-establish")
+        self._pending = {}
+        # One counter-based nonce source per session (salt || counter),
+        # replacing an os.urandom syscall per encrypted message. Only used
+        # while keys are process-local: with a shared (Redis-backed) store
+        # the same key is used by many workers and survives restarts, and
+        # independent counters with colliding 32-bit salts would reuse a
+        # nonce — key-compromising under GCM. Random nonces are safe to
+        # draw independently everywhere, so shared stores fall back to them.
+        self._counter_nonces_safe = not key_manager.is_shared
+        self._nonce_counters = {}
+        # Local (key, expires_at) cache per session id: skips the manager's
+        # lock + lookup + defensive copy on every message. Kept coherent by
+        # the manager's invalidation callbacks on store/delete/rotate.
+        self._key_cache = {}
+        self.key_manager.register_invalidation_listener(self._invalidate_session)
+
+    def _invalidate_session(self, session_id):
+        """Drops cached per-session state when the stored key changes."""
+        if session_id is None:
+            self._key_cache.clear()
+            self._nonce_counters.clear()
+            self.aes_encryptor.clear_key_cache()
+            with self._establish_locks_guard:
+                self._establish_locks.clear()
+        else:
+            entry = self._key_cache.pop(session_id, None)
+            if entry is not None:
+                # Retire the old key's cached AESGCM context as well.
+                self.aes_encryptor.discard_key(entry[0])
+            self._nonce_counters.pop(session_id, None)
+            # Reap the per-session establishment lock so the table doesn't
+            # grow by one Lock per pair ever seen. Threads already waiting
+            # on the popped lock still hold their reference and proceed
+            # through the has_key double-check as before.
+            with self._establish_locks_guard:
+                self._establish_locks.pop(session_id, None)
+
+    def _get_cached_key(self, user_id: str, peer_id: str):
+        """
+        Returns (session_id, key) for the pair, from the local cache when
+        possible. Raises ValueError if no session has been established.
+        """
+        session_id = self.key_manager._get_session_id(user_id, peer_id)
+        entry = self._key_cache.get(session_id)
+        if entry is not None:
+            key, expires_at, _generation = entry
+            if expires_at == 0 or time.time() < expires_at:
+                return session_id, key
+            self._key_cache.pop(session_id, None)
+
+        while True:
+            row = self.key_manager.get_key_with_expiry(user_id, peer_id)
+            if not row:
+                # An establishment may still be in flight for this session;
+                # wait for it rather than failing the caller.
+                future = self._pending.get(session_id)
+                if future is not None:
+                    future.result()
+                    row = self.key_manager.get_key_with_expiry(user_id, peer_id)
+            if not row:
+                raise ValueError(
+                    f"No session key found for {user_id}:{peer_id}. Please initiate session.")
+            self._key_cache[session_id] = row
+            # Re-validate after inserting: a concurrent rotate/delete may
+            # have retired — and zeroed — this row between the read and
+            # the cache insert, with its invalidation callback firing
+            # before our insert. A generation mismatch means the buffer is
+            # (or is about to be) wiped; evict and fetch the fresh row.
+            if self.key_manager.current_generation(session_id) == row[2]:
+                return session_id, row[0]
+            self._key_cache.pop(session_id, None)
+
+    def warm_up(self):
+        """
+        Pre-runs the QKD protocol once (discarding the result) so first-call
+        costs — RNG initialization, and kernel compilation when the Numba or
+        Catalyst backends are enabled — are paid at startup instead of on
+        the first user's /session/initiate.
+        """
+        self.qkd_engine.run_protocol(self.KEY_BIT_LENGTH)
+
+    def submit_establish_session_key(self, user_id: str, peer_id: str,
+                                     simulate_eavesdropper: bool = False) -> "concurrent.futures.Future":
+        """
+        Runs establish_session_key on the background pool and returns its
+        Future, so request handlers can await it (asyncio.wrap_future)
+        without blocking the event loop. Concurrent submissions for the
+        same session share one in-flight Future.
+        """
+        session_id = self.key_manager._get_session_id(user_id, peer_id)
+        with self._establish_locks_guard:
+            future = self._pending.get(session_id)
+            if future is not None and not future.done():
+                return future
+            future = self._executor.submit(
+                self.establish_session_key, user_id, peer_id, simulate_eavesdropper)
+            self._pending[session_id] = future
+        future.add_done_callback(
+            lambda _f, sid=session_id: self._pending.pop(sid, None))
+        return future
 
     def establish_session_key(self, user_id: str, peer_id: str, simulate_eavesdropper: bool = False):
         """
         Runs the full QKD + DEM protocol to establish a key.
+
+        If a non-expired session key already exists for the pair it is
+        reused and the QKD simulation is skipped entirely. The
+        simulate_eavesdropper path always re-runs the protocol, since its
+        whole point is to exercise the QBER check.
         """
-        print(f"Establishing key for {user_id}:{peer_id}...")
+        if not simulate_eavesdropper and self.key_manager.has_key(user_id, peer_id):
+            logger.debug("Reusing existing session key for %s:%s", user_id, peer_id)
+            return True
+
+        session_id = self.key_manager._get_session_id(user_id, peer_id)
+        with self._establish_locks_guard:
+            session_lock = self._establish_locks.setdefault(
+                session_id, threading.Lock())
+
+        with session_lock:
+            # Double-check: another thread may have finished establishing
+            # this session while we waited on the lock.
+            if not simulate_eavesdropper and self.key_manager.has_key(user_id, peer_id):
+                logger.debug("Reusing existing session key for %s:%s", user_id, peer_id)
+                return True
+            return self._establish_session_key_locked(
+                user_id, peer_id, simulate_eavesdropper)
+
+    def _establish_session_key_locked(self, user_id: str, peer_id: str, simulate_eavesdropper: bool):
+        if not self._engine_logged:
+            logger.info("AES engine: %s", self.aes_engine_name)
+            self._engine_logged = True
+        logger.debug("Establishing key for %s:%s...", user_id, peer_id)
 
         # 1. Run QKD protocol, passing the simulation flag
-        print("Running QKD protocol...")
+        qkd_start = time.perf_counter()
         qkd_key_hex = self.qkd_engine.run_protocol(
             self.KEY_BIT_LENGTH,
             simulate_eavesdropper=simulate_eavesdropper
         )
-        print("QKD key generated.")
+        qkd_ms = (time.perf_counter() - qkd_start) * 1000
 
-        # 2. Run DEM (HKDF) to finalize the key
-        print("Mixing QKD and classical entropy (HKDF)...")
-        final_key = generate_final_key(qkd_key_hex, self.KEY_BYTE_LENGTH)
-        print("Final key generated.")
+        # 2. Run DEM (HKDF) to finalize the key. The salt is bound to the
+        # canonical session id so the derivation is deterministic (and
+        # memoizable) per session.
+        dem_start = time.perf_counter()
+        session_id = self.key_manager._get_session_id(user_id, peer_id)
+        # Decode the QKD hex exactly once, at the engine boundary.
+        final_key = generate_final_key(
+            bytes.fromhex(qkd_key_hex), session_id, self.KEY_BYTE_LENGTH)
+        dem_ms = (time.perf_counter() - dem_start) * 1000
 
-        # 3. Store the key in the session manager
+        # 3. Store the key in the session manager. The invalidation
+        # callback resets this session's cached key and nonce counter.
         self.key_manager.store_key(user_id, peer_id, final_key)
-        print("Session key stored.")
+
+        # Single observability line instead of five eager prints; args are
+        # only formatted if the record is actually emitted.
+        logger.info(
+            "session_key_established user=%s peer=%s qkd_ms=%.2f dem_ms=%.2f",
+            user_id, peer_id, qkd_ms, dem_ms)
 
         return True
 
     def encrypt_data(self, plaintext: bytes, user_id: str, peer_id: str) -> bytes:
         """Encrypts data using the established session key."""
-        key = self.key_manager.get_key(user_id, peer_id)
-        if not key:
-            raise ValueError(f"No session key found for {user_id}:{peer_id}. Please initiate session.")
-            
-        return self.aes_encryptor.encrypt(plaintext, key)
+        session_id, key = self._get_cached_key(user_id, peer_id)
+        if not self._counter_nonces_safe:
+            # Shared key store: random nonce per message (see __init__).
+            return self.aes_encryptor.encrypt(plaintext, key)
+
+        nonce_counter = self._nonce_counters.get(session_id)
+        if nonce_counter is None:
+            nonce_counter = self._nonce_counters.setdefault(
+                session_id, self.aes_encryptor.new_session())
+
+        return self.aes_encryptor.encrypt(plaintext, key, nonce_counter=nonce_counter)
 
     def decrypt_data(self, encrypted_data: bytes, user_id: str, peer_id: str) -> bytes:
         """Decrypts data using the established session key."""
-        key = self.key_manager.get_key(user_id, peer_id)
-        if not key:
-            raise ValueError(f"No session key found for {user_id}:{peer_id}. Please initiate session.")
-        
+        _, key = self._get_cached_key(user_id, peer_id)
+
         # The ValueError from AESGCMEncryptor (tampering) will be propagated up
-        return self.aes_encryptor.decrypt(encrypted_data, key)
\ No newline at end of file
+        return self.aes_encryptor.decrypt(encrypted_data, key)
+
+    def decrypt_parts(self, nonce: bytes, ciphertext_with_tag: bytes, user_id: str, peer_id: str) -> bytes:
+        """Decrypts from separate nonce and ciphertext+tag buffers (no re-concat)."""
+        _, key = self._get_cached_key(user_id, peer_id)
+
+        return self.aes_encryptor.decrypt_parts(nonce, ciphertext_with_tag, key)
+
+    def encrypt_chunk(self, chunk: bytes, user_id: str, peer_id: str,
+                      nonce_prefix: bytes, counter: int) -> bytes:
+        """Encrypts one chunk of a streamed upload (see AESGCMEncryptor.encrypt_chunk)."""
+        _, key = self._get_cached_key(user_id, peer_id)
+
+        return self.aes_encryptor.encrypt_chunk(chunk, key, nonce_prefix, counter)
+
+    def decrypt_chunk(self, frame_body: bytes, user_id: str, peer_id: str,
+                      nonce_prefix: bytes, counter: int) -> bytes:
+        """Decrypts one framed chunk body of a streamed ciphertext."""
+        _, key = self._get_cached_key(user_id, peer_id)
+
+        return self.aes_encryptor.decrypt_chunk(frame_body, key, nonce_prefix, counter)
\ No newline at end of file
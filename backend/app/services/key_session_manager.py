@@ -1,41 +1,128 @@
 # backend/app/services/key_session_manager.py
 
+import functools
+import itertools
+import os
+import sys
 import threading
 import time
 import secrets
 import hmac
 from typing import Optional, Dict, Tuple
 
+# optional: shared multi-process store (install `redis`)
+try:
+    import redis
+except ImportError:
+    redis = None
+
 # Default key length for AES-256
 DEFAULT_KEY_LEN = 32  # bytes
 
+# Namespace for session keys stored in Redis.
+_REDIS_KEY_PREFIX = "quantumencryptx360:session:"
+
+
+@functools.lru_cache(maxsize=4096)
+def _make_session_id(user_id: str, peer_id: str) -> str:
+    """
+    Builds the canonical order-independent session id for a user pair.
+
+    Memoized: every store/get/has/delete call needs this id, and traffic
+    concentrates on a small set of pairs, so after the first call per
+    (user, peer) ordering the lower/sort/join work collapses to one cache
+    lookup. lru_cache is thread-safe; the lowered strings are interned so
+    repeat users compare by pointer.
+    """
+    return ":".join(sorted((sys.intern(user_id.lower()),
+                            sys.intern(peer_id.lower()))))
+
 
 class KeySessionManager:
     """
-    Thread-safe in-memory session key manager with optional TTL (expiry).
-    NOTE: This is suitable for development / single-process testing.
-    For production / multi-instance, replace with Redis or another centralized KVS.
+    Thread-safe session key manager with optional TTL (expiry).
+
+    By default keys live in an in-process dict (fine for development /
+    single-process testing). When a Redis URL is configured (constructor
+    arg or REDIS_URL env var) and the `redis` package is installed, Redis
+    becomes the source of truth — store/get/delete map to SET ... EX /
+    GET / DEL — so sessions are shared across workers and survive process
+    restarts. The local dict then acts as an L1 write-through cache, so
+    repeated lookups for the same pair don't round-trip Redis.
 
     Stored structure:
-      self._sessions: { session_id: (key_bytes, expires_at_timestamp_or_0) }
+      self._sessions: { session_id: (key_bytes, expires_at_timestamp_or_0, generation) }
+
+    The generation is a process-wide monotonic counter stamped on each
+    stored row. Because retired key buffers are zeroed in place, a caller
+    that cached a row concurrently with a rotate/delete could otherwise
+    end up holding an all-zero key; comparing the cached row's generation
+    against current_generation() detects that the row was retired.
     """
 
-    def __init__(self, default_ttl_seconds: int = 0, required_key_len: int = DEFAULT_KEY_LEN):
+    def __init__(self, default_ttl_seconds: int = 0, required_key_len: int = DEFAULT_KEY_LEN,
+                 redis_url: Optional[str] = None):
         """
         :param default_ttl_seconds: default TTL for stored keys (0 = never expire)
         :param required_key_len: length in bytes that keys must have (default 32 for AES-256)
+        :param redis_url: optional Redis URL; falls back to the REDIS_URL env var
         """
         self._sessions: Dict[str, Tuple[bytes, float]] = {}
-        self._lock = threading.RLock()
+        # Sharded write locks: store/delete for unrelated sessions no
+        # longer serialize on one manager-wide lock. Reads don't lock at
+        # all — a single dict.get/pop on a str key is atomic under the
+        # GIL — so concurrent encrypt/decrypt across sessions never block
+        # each other here.
+        self._shard_locks = [threading.Lock() for _ in range(64)]
+        # Monotonic row generations (itertools.count.__next__ is atomic
+        # under the GIL; stores additionally hold a shard lock).
+        self._generation = itertools.count(1)
         self._default_ttl = int(default_ttl_seconds)
         self._required_key_len = int(required_key_len)
 
+        # Callbacks invoked with the session_id whenever a stored key
+        # changes (store/delete/rotate), or with None when everything is
+        # cleared. Lets callers keep derived caches coherent.
+        self._listeners = []
+
+        self._redis = None
+        url = redis_url or os.getenv("REDIS_URL")
+        if url:
+            if redis is None:
+                raise RuntimeError(
+                    "REDIS_URL is configured but the 'redis' package is not installed.")
+            self._redis = redis.Redis.from_url(url)
+
+    @staticmethod
+    def _redis_key(session_id: str) -> str:
+        return _REDIS_KEY_PREFIX + session_id
+
+    @property
+    def is_shared(self) -> bool:
+        """True when keys live in a shared store and can outlive this process."""
+        return self._redis is not None
+
+    def _shard_lock(self, session_id: str) -> threading.Lock:
+        return self._shard_locks[hash(session_id) & 63]
+
+    def register_invalidation_listener(self, callback) -> None:
+        """
+        Register a callback fired when stored keys change.
+        It receives the affected session_id, or None when all sessions
+        were cleared.
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, session_id: Optional[str]) -> None:
+        for callback in self._listeners:
+            callback(session_id)
+
     def _get_session_id(self, user_id: str, peer_id: str) -> str:
         """
         Creates a consistent, order-independent session ID.
         "alice:bob" will be the same as "bob:alice".
         """
-        return ":".join(sorted([user_id.lower(), peer_id.lower()]))
+        return _make_session_id(user_id, peer_id)
 
     def _now(self) -> float:
         return time.time()
@@ -43,6 +130,12 @@ class KeySessionManager:
     def _is_expired(self, expires_at: float) -> bool:
         return expires_at != 0 and self._now() > expires_at
 
+    @staticmethod
+    def _wipe(key) -> None:
+        """Zeroes a retired key buffer in place (no-op for plain bytes)."""
+        if isinstance(key, bytearray):
+            key[:] = bytes(len(key))
+
     def store_key(self, user_id: str, peer_id: str, key: bytes, ttl_seconds: Optional[int] = None) -> None:
         """
         Store a key for the given user pair.
@@ -58,25 +151,81 @@ class KeySessionManager:
         ttl = self._default_ttl if ttl_seconds is None else int(ttl_seconds)
         expires_at = 0.0 if ttl <= 0 else (self._now() + ttl)
 
-        with self._lock:
-            self._sessions[session_id] = (bytes(key), expires_at)
+        if self._redis is not None:
+            self._redis.set(self._redis_key(session_id), bytes(key),
+                            ex=ttl if ttl > 0 else None)
+
+        # Write-through to the local cache either way. Keys are held as
+        # mutable bytearrays so retired material can be zeroed in place.
+        with self._shard_lock(session_id):
+            old_row = self._sessions.get(session_id)
+            self._sessions[session_id] = (
+                bytearray(key), expires_at, next(self._generation))
+        # Notify before wiping: listeners retire derived caches keyed by
+        # the old key's contents, so it must still be intact here.
+        self._notify(session_id)
+        if old_row:
+            self._wipe(old_row[0])
 
     def get_key(self, user_id: str, peer_id: str) -> Optional[bytes]:
         """
         Retrieve the key for the given user pair.
         Returns None if not found or expired.
         """
+        row = self.get_key_with_expiry(user_id, peer_id)
+        return row[0] if row else None
+
+    def get_key_with_expiry(self, user_id: str, peer_id: str) -> Optional[Tuple[bytes, float, int]]:
+        """
+        Like get_key, but returns (key, expires_at_timestamp_or_0,
+        generation) so callers caching the key can honor its expiry and
+        detect retirement themselves.
+
+        The returned key is the live stored buffer, not a defensive copy —
+        that removes an allocation + memcpy per encrypt/decrypt call.
+        Callers must treat it as read-only; it is zeroed in place when the
+        session is deleted, rotated or cleared. Callers that hold on to
+        the row must re-check current_generation() afterwards to rule out
+        a concurrent retirement (see class docstring).
+        """
         session_id = self._get_session_id(user_id, peer_id)
-        with self._lock:
-            row = self._sessions.get(session_id)
-            if not row:
-                return None
-            key, expires_at = row
+        # Lock-free read: dict.get is atomic, and the row tuple itself is
+        # never mutated, so a concurrent store can't hand us a torn value.
+        row = self._sessions.get(session_id)
+        if row:
+            key, expires_at, generation = row
             if self._is_expired(expires_at):
-                # remove expired entry
-                del self._sessions[session_id]
-                return None
-            return bytes(key)
+                # remove expired entry; pop is atomic, and racing another
+                # reader's pop of the same entry is harmless
+                expired = self._sessions.pop(session_id, None)
+                if expired:
+                    self._wipe(expired[0])
+            else:
+                return key, expires_at, generation
+
+        # L1 miss: another worker may have established this session.
+        if self._redis is not None:
+            redis_key = self._redis.get(self._redis_key(session_id))
+            if redis_key is not None:
+                # Mirror the server-side TTL into the local cache.
+                pttl_ms = self._redis.pttl(self._redis_key(session_id))
+                expires_at = (self._now() + pttl_ms / 1000.0) if pttl_ms and pttl_ms > 0 else 0.0
+                key = bytearray(redis_key)
+                generation = next(self._generation)
+                with self._shard_lock(session_id):
+                    self._sessions[session_id] = (key, expires_at, generation)
+                return key, expires_at, generation
+
+        return None
+
+    def current_generation(self, session_id: str) -> Optional[int]:
+        """
+        Generation of the live row for session_id, or None if there is
+        none. A row whose generation no longer matches has been retired
+        (and its key buffer zeroed).
+        """
+        row = self._sessions.get(session_id)
+        return row[2] if row else None
 
     def has_key(self, user_id: str, peer_id: str) -> bool:
         """Return True if a non-expired key exists for the pair."""
@@ -85,11 +234,18 @@ class KeySessionManager:
     def delete_key(self, user_id: str, peer_id: str) -> bool:
         """Delete a stored session key. Returns True if deleted."""
         session_id = self._get_session_id(user_id, peer_id)
-        with self._lock:
-            if session_id in self._sessions:
-                del self._sessions[session_id]
-                return True
-            return False
+        deleted = False
+        if self._redis is not None:
+            deleted = bool(self._redis.delete(self._redis_key(session_id)))
+        with self._shard_lock(session_id):
+            row = self._sessions.pop(session_id, None)
+        if row is not None:
+            deleted = True
+        if deleted:
+            self._notify(session_id)
+        if row is not None:
+            self._wipe(row[0])
+        return deleted
 
     def rotate_key(self, user_id: str, peer_id: str, ttl_seconds: Optional[int] = None) -> bytes:
         """
@@ -107,8 +263,14 @@ class KeySessionManager:
 
     def clear_all(self) -> None:
         """Clear all stored sessions (useful for tests)."""
-        with self._lock:
-            self._sessions.clear()
+        if self._redis is not None:
+            for redis_key in self._redis.scan_iter(match=_REDIS_KEY_PREFIX + "*"):
+                self._redis.delete(redis_key)
+        rows = list(self._sessions.values())
+        self._sessions.clear()
+        self._notify(None)
+        for row in rows:
+            self._wipe(row[0])
 
     # Optional helper for secure comparison if needed elsewhere:
     @staticmethod
@@ -117,7 +279,7 @@ class KeySessionManager:
         return hmac.compare_digest(a, b)
 
 
-# Example adapter notes for Redis:
-# - Replace store_key/get_key/delete_key with redis.set/get/del using a TTL.
-# - Use redis.set(session_id, key_bytes, ex=ttl_seconds) and redis.get(session_id).
-# - Make sure to store binary safely (Redis accepts bytes) and consider encryption-at-rest on your Redis host.
+# Redis deployment notes:
+# - Set REDIS_URL (e.g. redis://:password@host:6379/0) to enable the shared store.
+# - Keys are stored as raw bytes under the "quantumencryptx360:session:" prefix;
+#   consider encryption-at-rest on the Redis host.